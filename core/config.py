@@ -1,9 +1,14 @@
 """
 Configuration for the Topological Arbitrage System.
 """
+import sys
+import hashlib
+from dataclasses import dataclass
+from functools import cache
+from typing import Optional, Tuple
 
 # --- Tickers ---
-TICKERS = [
+TICKERS = (
     'CVX', 
     'NEE', 
     'DUK',
@@ -22,8 +27,19 @@ TICKERS = [
     'PG', 
     'CAT',
     'GOOGL', 
-    'META'
-]
+    'META',
+)
+# Sorted and interned once so column lookups and the cache key are stable
+# across processes regardless of the order listed above.
+TICKERS = tuple(sys.intern(t) for t in sorted(TICKERS))
+
+
+def tickers_hash(tickers) -> str:
+    """Short order-independent digest of a ticker set, used as a cache key."""
+    return hashlib.blake2b(b"\0".join(map(str.encode, sorted(tickers))), digest_size=4).hexdigest()
+
+
+TICKERS_HASH = tickers_hash(TICKERS)
 
 
 # --- Data ---
@@ -31,12 +47,26 @@ TIMEFRAME = '1d'
 BACKTEST_PERIOD = '20y'
 LOOKBACK_WINDOW = 80
 
+# --- Cache ---
+CACHE_DIR = 'cache'
+CACHE_TTL_HOURS = 24
+
 # --- Spatial Graph ---
 ALPHA = 0.3
 CORRELATION_THRESHOLD = 0.45
 
 # --- Topological ---
 MAX_DIMENSION = 3
+DIAGRAM_CACHE_SIZE = 128
+# Rips filtration cut-off passed to ripser as ``thresh``; None keeps the full
+# filtration (ripser already stops at the enclosing radius).
+MAX_EDGE_LENGTH = None
+# None runs ripser on every ticker (exact diagrams). An integer turns on a
+# greedy-permutation subsample of that many points, giving approximate
+# diagrams; dense distance matrices only.
+RIPSER_N_PERM = None
+# Persistence backend: 'ripser', or 'gudhi' (optional; collapses edges first)
+TDA_BACKEND = 'ripser'
 
 # --- Trading ---
 TRANSACTION_COST_BPS = 0.001
@@ -49,3 +79,36 @@ LEVERAGE_MULTIPLIER = 0.8
 STOP_LOSS_PCT = 0.05
 MAX_DRAWDOWN_LIMIT = 0.15
 
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Immutable snapshot of the settings above.
+
+    Safe to hash and to ship to worker processes; derive variants with
+    ``dataclasses.replace`` instead of mutating module globals.
+    """
+    tickers: Tuple[str, ...] = TICKERS
+    timeframe: str = TIMEFRAME
+    backtest_period: str = BACKTEST_PERIOD
+    lookback_window: int = LOOKBACK_WINDOW
+    cache_dir: str = CACHE_DIR
+    cache_ttl_hours: float = CACHE_TTL_HOURS
+    alpha: float = ALPHA
+    correlation_threshold: float = CORRELATION_THRESHOLD
+    max_dimension: int = MAX_DIMENSION
+    diagram_cache_size: int = DIAGRAM_CACHE_SIZE
+    max_edge_length: Optional[float] = MAX_EDGE_LENGTH
+    ripser_n_perm: Optional[int] = RIPSER_N_PERM
+    tda_backend: str = TDA_BACKEND
+    transaction_cost_bps: float = TRANSACTION_COST_BPS
+    rebalance_frequency: int = REBALANCE_FREQUENCY
+    monte_carlo_samples: int = MONTE_CARLO_SAMPLES
+    leverage_multiplier: float = LEVERAGE_MULTIPLIER
+    stop_loss_pct: float = STOP_LOSS_PCT
+    max_drawdown_limit: float = MAX_DRAWDOWN_LIMIT
+
+
+@cache
+def load() -> Config:
+    """Return the process-wide default ``Config``."""
+    return Config()
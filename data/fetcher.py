@@ -1,48 +1,136 @@
-import yfinance as yf
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
 import pandas as pd
 import numpy as np
-from typing import List
+from typing import List, Sequence
 from core import config
 
 
+_FILL_WORKERS = min(8, os.cpu_count() or 1)
+
+# Yahoo's spark endpoint returns closes for many symbols per request.
+_SPARK_URL = 'https://query1.finance.yahoo.com/v8/finance/spark'
+_SPARK_BATCH = 20
+_SPARK_TIMEOUT = 10
+
+# Extra bars kept ahead of the live lookback so forward-fill can bridge short gaps.
+_FFILL_PAD = 5
+
+
+def _ffill_inplace(col: np.ndarray):
+    """Forward-fill NaNs in a 1-D array; leading NaNs are left as-is."""
+    missing = np.isnan(col)
+    if missing.any():
+        last_valid = np.where(missing, 0, np.arange(len(col)))
+        np.maximum.accumulate(last_valid, out=last_valid)
+        col[:] = col[last_valid]
+
+
+def _download(**kwargs) -> pd.DataFrame:
+    """``yf.download`` with yfinance imported on first use; cache hits never pay for the import."""
+    import yfinance as yf
+    return yf.download(**kwargs)
+
+
+def _fetch_spark_batch(symbols: List[str], range_: str, interval: str) -> pd.DataFrame:
+    """Close prices for up to ``_SPARK_BATCH`` symbols from one spark request."""
+    query = urlencode({'symbols': ','.join(symbols), 'range': range_, 'interval': interval})
+    request = Request(f"{_SPARK_URL}?{query}", headers={'User-Agent': 'Mozilla/5.0'})
+    with urlopen(request, timeout=_SPARK_TIMEOUT) as response:
+        payload = json.load(response)
+
+    # Any malformed payload (non-dict entries, missing, null or ragged
+    # 'close') surfaces as ValueError so fetch_data falls back to yfinance.
+    columns = {}
+    try:
+        for symbol in symbols:
+            series = payload.get(symbol) or {}
+            if series.get('timestamp'):
+                close = series['close']
+                if not isinstance(close, list) or len(close) != len(series['timestamp']):
+                    raise ValueError(f"{symbol}: 'close' does not line up with 'timestamp'")
+                index = pd.to_datetime(series['timestamp'], unit='s', utc=True)
+                columns[symbol] = pd.Series(np.asarray(close, dtype=np.float64), index=index)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed spark response: {e!r}") from e
+    return pd.DataFrame(columns)
+
+
 class DataFetcher:
-    def __init__(self, tickers: List[str] = None, interval: str = config.TIMEFRAME):
-        self.tickers = tickers or config.TICKERS
+    def __init__(self, tickers: Sequence[str] = None, interval: str = config.TIMEFRAME):
+        # Normalized to a tuple once; the default universe is config's prebuilt tuple.
+        self.tickers = tuple(tickers) if tickers else config.TICKERS
         self.interval = interval
         self.buffer = pd.DataFrame()
 
     def fetch_data(self, lookback_minutes: int = config.LOOKBACK_WINDOW) -> pd.DataFrame:
-        """Fetch recent price data for all tickers via yfinance."""
+        """Fetch recent price data for all tickers.
+
+        Uses batched spark requests and falls back to ``yf.download`` if
+        those fail or come back empty.
+        """
         try:
-            data = yf.download(
-                tickers=self.tickers,
-                period='5d',
-                interval=self.interval,
-                group_by='ticker',
-                threads=True,
-                progress=False,
-            )
+            # Trim to the lookback (plus a small pad) before forward-filling,
+            # rather than filling the whole download and slicing afterwards.
+            keep = lookback_minutes + _FFILL_PAD
+            try:
+                df_close = self._fetch_spark('5d', tail=keep)
+            except (OSError, ValueError) as e:
+                print(f"Batched fetch failed, falling back to yfinance: {e}")
+                df_close = pd.DataFrame()
 
-            if data.empty:
-                return pd.DataFrame()
+            if df_close.empty:
+                data = _download(
+                    tickers=self.tickers,
+                    period='5d',
+                    interval=self.interval,
+                    group_by='ticker',
+                    threads=True,
+                    progress=False,
+                )
 
-            df_close = self._extract_close(data)
-            df_close = df_close.ffill().dropna()
+                if data.empty:
+                    return pd.DataFrame()
+
+                df_close = self._extract_close(data, tail=keep)
+
+            df_close = df_close.dropna()
 
             if len(df_close) > lookback_minutes:
                 df_close = df_close.iloc[-lookback_minutes:]
 
-            self.buffer = df_close
-            return df_close
+            self.buffer = self._column_major(df_close, dtype=np.float32)
+            return self.buffer
 
         except Exception as e:
             print(f"Error fetching data: {e}")
             return pd.DataFrame()
 
+    def _fetch_spark(self, range_: str, tail: int = None) -> pd.DataFrame:
+        """Forward-filled closes for all tickers, one request per batch of symbols, run concurrently."""
+        batches = [list(self.tickers[i:i + _SPARK_BATCH]) for i in range(0, len(self.tickers), _SPARK_BATCH)]
+        with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+            frames = list(pool.map(lambda batch: _fetch_spark_batch(batch, range_, self.interval), batches))
+        df_close = pd.concat(frames, axis=1).sort_index()
+        if tail is not None:
+            df_close = df_close.iloc[-tail:]
+        return df_close.ffill()
+
     def fetch_historical_data(self, period: str = config.BACKTEST_PERIOD) -> pd.DataFrame:
-        """Fetch longer-term historical daily close prices."""
+        """Fetch longer-term historical daily close prices (cached on disk)."""
+        cache_file = self._cache_path(period)
+        if self._is_fresh(cache_file + '.arrow'):
+            df_close = pd.read_feather(cache_file + '.arrow')
+            df_close = df_close.set_index(df_close.columns[0])
+            self.buffer = self._column_major(df_close)
+            return self.buffer
+
         try:
-            data = yf.download(
+            data = _download(
                 tickers=self.tickers,
                 period=period,
                 interval='1d',
@@ -55,41 +143,141 @@ class DataFetcher:
                 return pd.DataFrame()
 
             df_close = self._extract_close(data)
-            df_close = df_close.dropna(axis=1, how='all').ffill().bfill()
-            self.buffer = df_close
-            return df_close
+
+            # One vectorized count flags tickers that came back empty
+            # (delisted or renamed) and drops them in the same pass.
+            has_data = df_close.notna().sum() > 0
+            missing = pd.Index(self.tickers).difference(has_data.index[has_data], sort=False)
+            if len(missing):
+                print(f"No price data for: {', '.join(missing)}")
+            df_close = df_close.loc[:, has_data].bfill()
+            self.buffer = self._column_major(df_close)
+            self._write_cache(cache_file, self.buffer)
+            return self.buffer
 
         except Exception as e:
             print(f"Error fetching historical data: {e}")
             return pd.DataFrame()
 
+    def fetch_historical_returns(self, period: str = config.BACKTEST_PERIOD) -> pd.DataFrame:
+        """Daily float32 log returns over the full history, first bar set to 0.
+
+        Served from the cached ``.logret.npy`` next to the price cache when
+        it is at least as new as the ``.arrow`` prices, so repeated backtests
+        skip the full-matrix log pass. A missing or stale file is recomputed
+        and rewritten.
+        """
+        prices = self.fetch_historical_data(period=period)
+        if prices.empty:
+            return pd.DataFrame()
+
+        stem = self._cache_path(period)
+        price_file, logret_file = stem + '.arrow', stem + '.logret.npy'
+        if self._is_current(logret_file, price_file):
+            log_ret = np.load(logret_file, mmap_mode='r')
+            if log_ret.shape == prices.shape:
+                return pd.DataFrame(np.asarray(log_ret), index=prices.index, columns=prices.columns)
+
+        log_ret = self._log_returns(prices.to_numpy())
+        if os.path.exists(price_file):
+            try:
+                np.save(logret_file, log_ret)
+            except OSError as e:
+                print(f"Could not write returns cache: {e}")
+        return pd.DataFrame(log_ret, index=prices.index, columns=prices.columns)
+
     def get_returns(self) -> pd.DataFrame:
-        """Calculate log returns from the current buffer."""
+        """Calculate float32 log returns from the current buffer."""
         if self.buffer.empty:
             return pd.DataFrame()
-        return np.log(self.buffer / self.buffer.shift(1)).dropna()
+        # Differenced in float64 so small returns keep their precision, then
+        # stored as float32 like fetch_historical_returns.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_prices = np.log(self.buffer.to_numpy(dtype=np.float64))
+            log_ret = (log_prices[1:] - log_prices[:-1]).astype(np.float32)
+        return pd.DataFrame(log_ret, index=self.buffer.index[1:], columns=self.buffer.columns).dropna()
 
     # ------------------------------------------------------------------
-    def _extract_close(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Pull 'Close' prices out of a yfinance download DataFrame."""
+    def _cache_path(self, period: str) -> str:
+        """Cache file stem; prices live in ``<stem>.arrow``."""
+        key = config.TICKERS_HASH if self.tickers == config.TICKERS else config.tickers_hash(self.tickers)
+        return os.path.join(config.CACHE_DIR, f"prices_{period}_{key}")
+
+    @staticmethod
+    def _is_fresh(cache_file: str) -> bool:
+        if not os.path.exists(cache_file):
+            return False
+        return time.time() - os.path.getmtime(cache_file) < config.CACHE_TTL_HOURS * 3600
+
+    @staticmethod
+    def _is_current(derived_file: str, source_file: str) -> bool:
+        """Whether ``derived_file`` exists and was written no earlier than ``source_file``."""
+        if not (os.path.exists(derived_file) and os.path.exists(source_file)):
+            return False
+        return os.path.getmtime(derived_file) >= os.path.getmtime(source_file)
+
+    def _write_cache(self, cache_file: str, df_close: pd.DataFrame):
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            df_close.reset_index().to_feather(cache_file + '.arrow', compression='lz4')
+            np.save(cache_file + '.logret.npy', self._log_returns(df_close.to_numpy()))
+        except OSError as e:
+            print(f"Could not write price cache: {e}")
+
+    @staticmethod
+    def _column_major(df_close: pd.DataFrame, dtype=np.float64) -> pd.DataFrame:
+        """Re-wrap prices over a Fortran-ordered block so each ticker's history is contiguous."""
+        prices = np.asfortranarray(df_close.to_numpy(dtype=dtype))
+        return pd.DataFrame(prices, index=df_close.index, columns=df_close.columns, copy=False)
+
+    @staticmethod
+    def _log_returns(prices: np.ndarray) -> np.ndarray:
+        """float32 log(p_t / p_{t-1}) with a zero first row and NaNs replaced by 0."""
+        log_ret = np.zeros(prices.shape, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_prices = np.log(prices)
+            np.subtract(log_prices[1:], log_prices[:-1], out=log_ret[1:])
+        log_ret[np.isnan(log_ret)] = 0.0
+        return log_ret.astype(np.float32)
+
+    def _extract_close(self, data: pd.DataFrame, tail: int = None) -> pd.DataFrame:
+        """Pull forward-filled 'Close' prices out of a yfinance download DataFrame.
+
+        With ``tail``, only the last ``tail`` rows are extracted and filled.
+        """
+        if tail is not None:
+            data = data.iloc[-tail:]
         df_close = pd.DataFrame()
 
         if len(self.tickers) == 1:
-            if 'Close' in data.columns:
-                df_close[self.tickers[0]] = data['Close']
-            return df_close
+            ticker = self.tickers[0]
+            if isinstance(data.columns, pd.MultiIndex) and (ticker, 'Close') in data.columns:
+                df_close[ticker] = data[(ticker, 'Close')]
+            elif 'Close' in data.columns:
+                df_close[ticker] = data['Close']
+            return df_close.ffill()
 
-        for ticker in self.tickers:
-            try:
-                if isinstance(data.columns, pd.MultiIndex):
-                    if (ticker, 'Close') in data.columns:
-                        df_close[ticker] = data[(ticker, 'Close')]
-                elif f"Close_{ticker}" in data.columns:
-                    df_close[ticker] = data[f"Close_{ticker}"]
-            except KeyError:
-                pass
-
-        return df_close
+        # One columnar slice pulls every ticker's Close at once, whichever
+        # layout yfinance returned.
+        if isinstance(data.columns, pd.MultiIndex):
+            closes = data.xs('Close', axis=1, level=1)
+        else:
+            closes = data.loc[:, data.columns.str.startswith('Close_')]
+            closes.columns = closes.columns.str[len('Close_'):]
+        present = pd.Index(self.tickers).intersection(closes.columns, sort=False)
+
+        # Copy into one column-major block and wrap it once. Columns are
+        # independent, so the forward-fill runs per column on a thread pool
+        # (NumPy releases the GIL for the gathers).
+        close = np.asfortranarray(closes[present].to_numpy(dtype=np.float64, copy=True))
+
+        def fill_column(j: int):
+            _ffill_inplace(close[:, j])
+
+        with ThreadPoolExecutor(max_workers=_FILL_WORKERS) as pool:
+            list(pool.map(fill_column, range(len(present))))
+
+        return pd.DataFrame(close, index=data.index, columns=list(present), copy=False)
 
 if __name__ == "__main__":
     fetcher = DataFetcher()
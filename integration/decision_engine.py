@@ -1,8 +1,26 @@
 import pandas as pd
 import numpy as np
-from typing import Dict
+from typing import Dict, Tuple, Union
 from core import config
 
+
+def _zscores(values: np.ndarray) -> np.ndarray:
+    """Sample-std (ddof=1) z-scores built in a single scratch array."""
+    if values.size < 2:
+        # The sample std is undefined; no name can stand out
+        return np.zeros_like(values)
+    z = values - values.mean()
+    z /= np.sqrt(np.dot(z, z) / (z.size - 1)) + 1e-6
+    return z
+
+
+def _top_k(positions: np.ndarray, keys: np.ndarray, k: int) -> np.ndarray:
+    """The ``k`` entries of ``positions`` with the smallest ``keys``, in no particular order."""
+    if positions.size > k:
+        positions = positions[np.argpartition(keys[positions], k - 1)[:k]]
+    return positions
+
+
 class IntegrationEngine:
 
     def __init__(self):
@@ -40,8 +58,19 @@ class IntegrationEngine:
         Simplified signal generation without confidence filtering.
         Uses binary regime switch with hysteresis for energy markets.
         """
-        
-        z_scores = (residuals - residuals.mean()) / (residuals.std() + 1e-6)
+        positions, weights = self.generate_weights(residuals.to_numpy(), regime_metrics, current_drawdown, returns_history)
+        out = np.zeros(len(residuals))
+        out[positions] = weights
+        return pd.DataFrame({'Signal': out}, index=residuals.index)
+
+    def generate_weights(self, residuals: Union[pd.Series, np.ndarray], regime_metrics: Dict[str, float],
+                         current_drawdown: float = 0.0, returns_history: pd.Series = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same as ``generate_signals`` but returns only the traded names, as
+        integer positions into ``residuals`` and their signed weights; every
+        other position is flat.
+        """
+        raw_signals = _zscores(np.asarray(residuals, dtype=np.float64))
         h1_persistence = regime_metrics.get('max_persistence_h1', 0.0)
         
         # --- REGIME SWITCH  ---
@@ -56,17 +85,19 @@ class IntegrationEngine:
                 self.regime_state = 'revert'
         # else: stay in current regime
         
-        raw_signals = z_scores if self.regime_state == 'trend' else -z_scores
+        if self.regime_state != 'trend':
+            np.negative(raw_signals, out=raw_signals)
         
         # --- SIGNAL FILTERING  ---
-        significant = raw_signals[abs(raw_signals) > 1.0]
-        if significant.empty:
-            significant = raw_signals[abs(raw_signals) > 0.4]
-            
-        sorted_sig = significant.sort_values(ascending=False)
-        top_n = min(6, len(sorted_sig))
-        longs = sorted_sig[sorted_sig > 0].head(top_n)
-        shorts = sorted_sig[sorted_sig < 0].tail(top_n)
+        magnitude = np.abs(raw_signals)
+        significant = np.flatnonzero(magnitude > 1.0)
+        if not significant.size:
+            significant = np.flatnonzero(magnitude > 0.4)
+
+        # Partial selection; weights are per name, so the picks need no ordering
+        top_n = min(6, significant.size)
+        longs = _top_k(significant[raw_signals[significant] > 0], -raw_signals, top_n)
+        shorts = _top_k(significant[raw_signals[significant] < 0], raw_signals, top_n)
         
         # --- RISK MANAGEMENT ---
         risk_multiplier = self.get_risk_scalars(h1_persistence, current_drawdown, returns_history)
@@ -78,12 +109,11 @@ class IntegrationEngine:
         long_total = ((1.0 + adaptive_net) / 2.0) * active_leverage
         short_total = ((1.0 - adaptive_net) / 2.0) * active_leverage
         
-        signals = pd.DataFrame(0.0, index=residuals.index, columns=['Signal'])
-        if not longs.empty:
-            exp_weights = np.exp(longs * 0.5)
-            signals.loc[longs.index, 'Signal'] = long_total * exp_weights / exp_weights.sum()
-        if not shorts.empty:
-            exp_weights = np.exp(np.abs(shorts) * 0.5)
-            signals.loc[shorts.index, 'Signal'] = -short_total * exp_weights / exp_weights.sum()
-        
-        return signals
\ No newline at end of file
+        long_weights = np.exp(raw_signals[longs] * 0.5)
+        short_weights = np.exp(magnitude[shorts] * 0.5)
+        if long_weights.size:
+            long_weights *= long_total / long_weights.sum()
+        if short_weights.size:
+            short_weights *= -short_total / short_weights.sum()
+
+        return np.concatenate([longs, shorts]), np.concatenate([long_weights, short_weights])
\ No newline at end of file
@@ -35,7 +35,7 @@ def main():
 
     print("\nRunning Persistent Homology...")
     point_cloud = topo.create_point_cloud(spatial.adjacency_matrix)
-    diagrams = topo.compute_persistence_diagrams(point_cloud)
+    diagrams = topo.compute_persistence_diagrams(point_cloud, maxdim=1)
     regime_metrics = topo.get_regime_metrics(diagrams)
     print(f"Regime Metrics: {regime_metrics}")
 
@@ -1,16 +1,16 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
 from datetime import datetime
 from typing import Tuple, Dict, List, Optional
-import yfinance as yf
 
 from core import config
 from data.fetcher import DataFetcher
-from spatial.laplacian import SpatialGraph
+from spatial.laplacian import SpatialGraph, RollingCorrelation
 from topological.homology import TopologicalFeatureExtractor
 from integration.decision_engine import IntegrationEngine
 
@@ -21,66 +21,227 @@ def run_single_simulation(
     rebal: int,
     cost_bps: float,
     stop_loss_pct: float,
-    verbose: bool = False
+    verbose: bool = False,
+    alpha: float = config.ALPHA,
+    correlation_threshold: float = config.CORRELATION_THRESHOLD
 ) -> Tuple[np.ndarray, np.ndarray]:
     """Core simulation: returns equity curve and daily PnL as arrays."""
-    spatial = SpatialGraph()
+    spatial = SpatialGraph(correlation_threshold=correlation_threshold, alpha=alpha)
     topo = TopologicalFeatureExtractor()
     engine = IntegrationEngine()
 
-    n_bars = len(returns)
-    portfolio_values = [1.0]
-    daily_pnl = []
-    prev_weights = pd.Series(0.0, index=returns.columns)
-
-    for i in range(window - 1, n_bars - 1):
-        window_returns = returns.iloc[i - window + 1: i + 1]
-        current_vec = window_returns.iloc[-1]
-
-        if i % rebal == 0:
-            try:
-                G = spatial.build_graph(window_returns)
-                spatial.compute_laplacian(G)
-                dist = topo.create_point_cloud(spatial.adjacency_matrix)
-                diagrams = topo.compute_persistence_diagrams(dist)
-                regime_metrics = topo.get_regime_metrics(diagrams)
-                diffusion = spatial.compute_diffusion_signal(current_vec)
-                residuals = spatial.get_residuals(current_vec, diffusion)
-            except Exception:
-                residuals = pd.Series(0, index=current_vec.index)
-                regime_metrics = {'max_persistence_h1': 0.0}
-
-            lookback_slice = portfolio_values[-252:] if len(portfolio_values) > 252 else portfolio_values
-            rolling_peak = max(lookback_slice)
-            current_dd = (portfolio_values[-1] / rolling_peak) - 1
-            history_series = pd.Series(daily_pnl)
-
-            signals = engine.generate_signals(
-                residuals,
-                regime_metrics,
-                current_drawdown=current_dd,
-                returns_history=history_series
-            )
-
-            current_weights = pd.Series(0.0, index=returns.columns)
-            active = signals[signals['Signal'] != 0]['Signal']
-            current_weights.loc[active.index] = active
-        else:
-            current_weights = prev_weights.copy()
-
-        current_weights[(current_weights * returns.iloc[i]) < -stop_loss_pct] = 0.0
-        turnover = np.sum(np.abs(current_weights - prev_weights))
-        step_cost = turnover * cost_bps
-        prev_weights = current_weights
-
-        step_pnl = np.sum(current_weights * returns.iloc[i + 1]) - step_cost
-        daily_pnl.append(step_pnl)
-        portfolio_values.append(portfolio_values[-1] * (1 + step_pnl))
-
-        if verbose and i % 100 == 0:
-            print(f"  Step {i}/{n_bars} | Equity: {portfolio_values[-1]:.4f}")
-
-    return np.array(portfolio_values), np.array(daily_pnl)
+    # One contiguous float32 matrix for the whole run; column-major so each
+    # asset's window slice is contiguous. Returns are quantized to float32
+    # (well below the noise the graph/topology pipeline reacts to); every
+    # reduction over them (correlations, PnL, equity) accumulates in float64.
+    columns = returns.columns
+    R = np.asfortranarray(returns.to_numpy(dtype=np.float32))
+    n_bars, n_assets = R.shape
+    n_steps = max(n_bars - window, 0)
+
+    # Step k trades bar i = window - 1 + k. Only rebalance bars run the
+    # graph/topology pipeline; the bars in between hold the same weights
+    # (minus stop-outs), so each segment is booked with one vector pass.
+    portfolio_values = np.ones(n_steps + 1)
+    daily_pnl = np.zeros(n_steps)
+    rebal_steps = range((1 - window) % rebal, n_steps, rebal)
+
+    # Buffers reused across rebalances instead of reallocated per segment.
+    held_buf = np.empty((min(rebal, n_steps), n_assets))
+    weights = np.zeros(n_assets)
+    prev_weights = np.zeros(n_assets)
+    zero_residuals = np.zeros(n_assets)
+    rolling_corr = RollingCorrelation(R, window)
+
+    def report(lo: int, hi: int):
+        for k in range(lo + (-(window - 1 + lo) % 100), hi, 100):
+            print(f"  Step {window - 1 + k}/{n_bars} | Equity: {portfolio_values[k + 1]:.4f}")
+
+    if verbose and rebal_steps:
+        report(0, rebal_steps[0])
+
+    # Bound once so the rebalance loop does local rather than attribute lookups.
+    laplacian_from_returns = spatial.compute_laplacian_from_returns
+    diffusion_signal, get_residuals = spatial.compute_diffusion_signal, spatial.get_residuals
+    point_cloud, persistence = topo.create_point_cloud, topo.compute_persistence_diagrams
+    regime_of, generate_weights = topo.get_regime_metrics, engine.generate_weights
+    add, cumprod = np.add, np.cumprod
+    equity = 1.0
+
+    for k in rebal_steps:
+        i = window - 1 + k
+        end = min(k + rebal, n_steps)
+        window_returns = R[i - window + 1: i + 1]
+        current_vec = R[i]
+        try:
+            laplacian_from_returns(window_returns, labels=columns, corr=rolling_corr.at(i + 1))
+            dist = point_cloud(spatial.adjacency_matrix)
+            diagrams = persistence(dist, maxdim=1)  # the regime metrics read H1 only
+            regime_metrics = regime_of(diagrams)
+            diffusion = diffusion_signal(current_vec)
+            residuals = get_residuals(current_vec, diffusion)
+        except Exception:
+            residuals = zero_residuals
+            regime_metrics = {'max_persistence_h1': 0.0}
+
+        rolling_peak = portfolio_values[max(0, k + 1 - 252): k + 1].max()
+        current_dd = (equity / rolling_peak) - 1
+        history_series = pd.Series(daily_pnl[:k], copy=False)
+
+        positions, position_weights = generate_weights(
+            residuals,
+            regime_metrics,
+            current_drawdown=current_dd,
+            returns_history=history_series
+        )
+        weights.fill(0.0)
+        weights[positions] = position_weights
+
+        held, daily_pnl[k:end] = _step_segment(
+            weights, R[i: i + end - k], R[i + 1: i + 1 + end - k], prev_weights, cost_bps, stop_loss_pct,
+            out=held_buf[:end - k]
+        )
+        # Compound the segment in place in its slice of portfolio_values
+        segment = portfolio_values[k + 1: end + 1]
+        add(1.0, daily_pnl[k:end], out=segment)
+        cumprod(segment, out=segment)
+        segment *= equity
+        equity = portfolio_values[end]
+        np.copyto(prev_weights, held[-1])
+
+        if verbose:
+            report(k, end)
+
+    return portfolio_values, daily_pnl
+
+
+def _step_segment(
+    weights: np.ndarray,
+    bars: np.ndarray,
+    next_bars: np.ndarray,
+    prev_weights: np.ndarray,
+    cost_bps: float,
+    stop_loss_pct: float,
+    out: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hold ``weights`` over a run of bars between rebalances.
+
+    Returns the held weights per bar (a stopped-out position stays flat
+    until the next rebalance), written into ``out`` when given, and the net
+    PnL per bar: the row-wise dot with the next bar's returns less turnover
+    cost.
+    """
+    stopped = np.logical_or.accumulate((weights * bars) < -stop_loss_pct, axis=0)
+    held = np.empty(bars.shape) if out is None else out
+    np.copyto(held, weights)
+    if not stopped[-1:].any():
+        # No stop hit: every bar holds ``weights``, so the PnL is one
+        # matrix-vector product and only the first bar trades.
+        pnl = next_bars @ weights
+        pnl[:1] -= cost_bps * np.abs(weights - prev_weights).sum()
+        return held, pnl
+    held[stopped] = 0.0
+
+    turnover = np.diff(held, axis=0, prepend=prev_weights[None, :])
+    np.abs(turnover, out=turnover)
+    pnl = np.einsum('ij,ij->i', held, next_bars, dtype=np.float64)
+    pnl -= cost_bps * turnover.sum(axis=1)
+    return held, pnl
+
+
+@dataclass
+class BacktestContext:
+    """
+    A returns matrix plus the simulation parameters to run on it.
+
+    Built once per dataset and handed to pool workers (the matrix through
+    shared memory), so each job only carries what changes: parameter
+    overrides or the rows of a bootstrap resample.
+    """
+    returns: np.ndarray
+    index: pd.Index
+    columns: pd.Index
+    params: Dict = field(default_factory=dict)
+
+    @classmethod
+    def from_frame(cls, returns: pd.DataFrame, **params) -> 'BacktestContext':
+        return cls(returns.to_numpy(), returns.index, returns.columns, params)
+
+    def frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """The returns as a DataFrame, optionally resampled to ``rows`` (dates are kept)."""
+        if rows is None:
+            return pd.DataFrame(self.returns, index=self.index, columns=self.columns, copy=False)
+        return pd.DataFrame(self.returns[rows], index=self.index, columns=self.columns)
+
+    def run(self, rows: Optional[np.ndarray] = None, **overrides) -> Tuple[np.ndarray, np.ndarray]:
+        """``run_single_simulation`` on ``frame(rows)`` with ``params`` updated by ``overrides``."""
+        return run_single_simulation(self.frame(rows), **{**self.params, **overrides})
+
+
+_WORKER = {}
+
+
+def _attach_context(shm_name: str, shape: Tuple[int, int], dtype: str,
+                    index: pd.Index, columns: pd.Index, params: Dict):
+    """Pool initializer: map the shared returns block once per worker, without a copy."""
+    shm = SharedMemory(name=shm_name)
+    returns = np.ndarray(shape, dtype, buffer=shm.buf, order='F')
+    _WORKER.update(shm=shm, context=BacktestContext(returns, index, columns, params))
+
+
+@contextmanager
+def _context_pool(context: BacktestContext, max_workers: Optional[int] = None):
+    """Process pool whose workers share one copy of ``context``; unlinked on exit."""
+    returns = context.returns
+    shm = SharedMemory(create=True, size=max(returns.nbytes, 1))
+    try:
+        np.ndarray(returns.shape, returns.dtype, buffer=shm.buf, order='F')[...] = returns
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_context,
+                                 initargs=(shm.name, returns.shape, returns.dtype.str,
+                                           context.index, context.columns, context.params)) as pool:
+            yield pool
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def sweep(returns: pd.DataFrame, param_grid: List[Dict], max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Run one deterministic backtest per parameter set across a process pool.
+
+    Each entry of ``param_grid`` overrides keyword arguments of
+    ``run_single_simulation`` (window, rebal, cost_bps, stop_loss_pct, alpha,
+    correlation_threshold); anything omitted falls back to ``config.load()``.
+    Parameters travel with each job, so workers never touch config globals;
+    the returns matrix is shared with the workers rather than pickled per job.
+    """
+    cfg = config.load()
+    context = BacktestContext.from_frame(
+        returns,
+        window=cfg.lookback_window,
+        rebal=cfg.rebalance_frequency,
+        cost_bps=cfg.transaction_cost_bps,
+        stop_loss_pct=cfg.stop_loss_pct,
+        alpha=cfg.alpha,
+        correlation_threshold=cfg.correlation_threshold,
+    )
+    with _context_pool(context, max_workers) as pool:
+        rows = list(pool.map(_sweep_one, param_grid))
+    return pd.DataFrame(rows)
+
+
+def _sweep_one(params: Dict) -> Dict:
+    context = _WORKER['context']
+    kwargs = {**context.params, **params}
+    equity, daily = context.run(**params)
+    metrics = compute_metrics(equity, daily, context.index, kwargs['window'])
+    return {
+        **kwargs,
+        'final_equity': metrics['final_equity'],
+        'sharpe': metrics['sharpe'],
+        'sortino': metrics['sortino'],
+    }
 
 
 def compute_metrics(equity: np.ndarray, daily_ret: np.ndarray, returns_index: pd.DatetimeIndex, window: int) -> Dict:
@@ -93,11 +254,13 @@ def compute_metrics(equity: np.ndarray, daily_ret: np.ndarray, returns_index: pd
     downside_std = downside.std() if len(downside) > 0 else 0.0
     sortino = np.sqrt(252) * (daily_ret.mean() / downside_std) if downside_std > 0 else 0.0
 
-    annual_returns = {}
-    for year, yr in daily_series.groupby(daily_series.index.year):
-        yr_ret = yr.values
-        yr_sharpe = np.sqrt(252) * yr_ret.mean() / yr_ret.std() if yr_ret.std() > 0 else 0.0
-        annual_returns[year] = {'return': yr_ret.sum(), 'sharpe': yr_sharpe}
+    by_year = daily_series.groupby(daily_series.index.year)
+    yearly = by_year.agg(['sum', 'mean'])
+    yearly_std = by_year.std(ddof=0)
+    annual_returns = pd.DataFrame({
+        'return': yearly['sum'],
+        'sharpe': (np.sqrt(252) * yearly['mean'] / yearly_std.where(yearly_std > 0)).fillna(0.0),
+    })
 
     return {
         'equity_series': equity_series,
@@ -109,8 +272,17 @@ def compute_metrics(equity: np.ndarray, daily_ret: np.ndarray, returns_index: pd
     }
 
 
+def _pyplot():
+    """Import pyplot lazily, on the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def plot_deterministic(metrics: Dict, save_path: str):
     """Plot equity curve for deterministic run."""
+    plt = _pyplot()
     fig, ax = plt.subplots(figsize=(12, 6))
     metrics['equity_series'].plot(ax=ax, label='Equity Curve', color='#1f77b4', lw=2)
     ax.set_title(f"Topological Strategy Performance (Sharpe: {metrics['sharpe']:.2f})", fontsize=14)
@@ -120,9 +292,11 @@ def plot_deterministic(metrics: Dict, save_path: str):
     plt.close()
 
 
-def plot_monte_carlo(equities: List[np.ndarray], final_equities: np.ndarray, annual_returns: np.ndarray, save_path: str):
+def plot_monte_carlo(equities: np.ndarray, final_equities: np.ndarray, annual_returns: np.ndarray, save_path: str,
+                     rng: Optional[np.random.Generator] = None):
     """Plot distribution, QQ, and sample paths for Monte Carlo."""
     from scipy import stats
+    plt = _pyplot()
     var_95 = np.percentile(final_equities, 5)
     median_eq = np.median(final_equities)
 
@@ -148,12 +322,15 @@ def plot_monte_carlo(equities: List[np.ndarray], final_equities: np.ndarray, ann
     axes[0, 1].legend()
     axes[0, 1].grid(True, alpha=0.3)
 
-    sample_idx = np.random.choice(len(equities), min(100, len(equities)), replace=False)
-    for idx in sample_idx:
-        axes[1, 0].plot(equities[idx], color='#1f77b4', alpha=0.1, linewidth=0.5)
-    max_len = max(len(c) for c in equities)
-    padded = np.array([np.pad(c, (0, max_len - len(c)), constant_values=c[-1]) for c in equities])
-    median_path = np.median(padded, axis=0)
+    rng = rng if rng is not None else np.random.default_rng()
+    sample_idx = rng.choice(len(equities), min(100, len(equities)), replace=False)
+    # All sampled paths go into one LineCollection: a single artist to draw
+    # instead of one Line2D per path.
+    from matplotlib.collections import LineCollection
+    steps = np.broadcast_to(np.arange(equities.shape[1]), (len(sample_idx), equities.shape[1]))
+    paths = np.stack([steps, equities[sample_idx]], axis=-1)
+    axes[1, 0].add_collection(LineCollection(paths, colors='#1f77b4', alpha=0.1, linewidths=0.5))
+    median_path = np.median(equities, axis=0)
     axes[1, 0].plot(median_path, color='red', linewidth=2, label='Median Path')
     axes[1, 0].axhline(1.0, color='black', linestyle='--', linewidth=1, label='Breakeven')
     axes[1, 0].set_title('Sample Equity Curves (100 random paths)')
@@ -171,18 +348,20 @@ def plot_monte_carlo(equities: List[np.ndarray], final_equities: np.ndarray, ann
     plt.close()
 
 
-def buy_and_hold_returns(tickers: List[str], period: str = config.BACKTEST_PERIOD) -> pd.DataFrame:
+def buy_and_hold_returns(tickers: List[str], period: str = config.BACKTEST_PERIOD,
+                         prices: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Returns the cumulative return for each ticker and the equal‑weight portfolio.
+    Pass already-loaded ``prices`` to skip the fetch.
     """
-    fetcher = DataFetcher()
-    prices = fetcher.fetch_historical_data(period=period)
+    if prices is None:
+        prices = DataFetcher(tickers).fetch_historical_data(period=period)
     if prices.empty:
         return pd.DataFrame()
     
-    # Keep only tickers that exist in the data
-    available = [t for t in tickers if t in prices.columns]
-    if not available:
+    # Keep only tickers that exist in the data (one hashed Index lookup)
+    available = pd.Index(tickers).intersection(prices.columns, sort=False)
+    if available.empty:
         return pd.DataFrame()
     
     prices = prices[available]
@@ -208,62 +387,81 @@ def buy_and_hold_returns(tickers: List[str], period: str = config.BACKTEST_PERIO
     return df
 
 def snp500_returns(period: str = config.BACKTEST_PERIOD) -> pd.Series:
-    """Fetch SPY cumulative return using yfinance directly."""
-    try:
-        data = yf.download('SPY', period=period, interval='1d', progress=False)
-        if data.empty:
-            return pd.Series(dtype=float)
-        start = data['Close'].iloc[0]
-        end = data['Close'].iloc[-1]
-        return pd.Series({
-            'Start Price': start,
-            'End Price': end,
-            'Return': (end / start) - 1
-        })
-    except Exception as e:
-        print(f"SPY fetch error: {e}")
+    """Fetch SPY cumulative return through the cached ``DataFetcher``."""
+    data = DataFetcher(('SPY',)).fetch_historical_data(period=period)
+    if data.empty:
         return pd.Series(dtype=float)
+    start = data.iloc[0]
+    end = data.iloc[-1]
+    return pd.Series({
+        'Start Price': start,
+        'End Price': end,
+        'Return': (end / start) - 1
+    })
+
+# Bootstrap paths resampled and dispatched per batch.
+_BOOTSTRAP_CHUNK = 64
+
 
-def run_backtest(progress_interval: int = 100, save_plots: bool = True):
+def _bootstrap_one(idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Run one resampled path; returns its float32 equity curve and daily PnL."""
+    equity, daily_ret = _WORKER['context'].run(idx, verbose=False)
+    return equity.astype(np.float32), daily_ret.astype(np.float32)
+
+
+def run_backtest(progress_interval: int = 100, save_plots: bool = False, max_workers: Optional[int] = None,
+                 seed: Optional[int] = None, returns: Optional[pd.DataFrame] = None,
+                 prices: Optional[pd.DataFrame] = None) -> Optional[Dict]:
     """
     Run both deterministic and Monte Carlo backtests.
-    This is the single entry point for the entire backtest suite.
+    Pass loaded daily log ``returns`` (and their ``prices``, for the benchmark)
+    to skip the fetch.
     """
+    cfg = config.load()
+    rng = np.random.default_rng(seed)
     # Fetch data once
-    fetcher = DataFetcher() 
-    prices = fetcher.fetch_historical_data(period=config.BACKTEST_PERIOD)
-    if prices.empty:
+    fetcher = DataFetcher()
+    all_returns = returns if returns is not None else fetcher.fetch_historical_returns(period=cfg.backtest_period)
+    if all_returns.empty:
         print("No data available.")
         return
 
-    all_returns = np.log(prices / prices.shift(1)).fillna(0.0)
+    returns_mat = np.asfortranarray(all_returns.to_numpy(dtype=np.float32))
     n_bars = len(all_returns)
     print(f"Data: {n_bars} bars, {len(all_returns.columns)} assets")
 
+    # Benchmark fetches are I/O-bound; load them in the background while the
+    # deterministic backtest computes.
+    benchmarks = ThreadPoolExecutor(max_workers=2)
+    bh_future = benchmarks.submit(buy_and_hold_returns, list(all_returns.columns),
+                                  prices=fetcher.buffer if returns is None else prices)
+    snp_future = benchmarks.submit(snp500_returns)
+    benchmarks.shutdown(wait=False)
+
     # ==============================
     # 1. DETERMINISTIC BACKTEST
     # ==============================
-    print(f"\nRunning deterministic backtest (window={config.LOOKBACK_WINDOW})...")
-    equity_det, daily_det = run_single_simulation(
-        all_returns,
-        window=config.LOOKBACK_WINDOW,
-        rebal=config.REBALANCE_FREQUENCY,
-        cost_bps=config.TRANSACTION_COST_BPS,
-        stop_loss_pct=config.STOP_LOSS_PCT,
-        verbose=True
-    )
-    det_metrics = compute_metrics(equity_det, daily_det, all_returns.index, config.LOOKBACK_WINDOW)
-    bh_returns = buy_and_hold_returns(config.TICKERS)
+    print(f"\nRunning deterministic backtest (window={cfg.lookback_window})...")
+    context = BacktestContext(returns_mat, all_returns.index, all_returns.columns, {
+        'window': cfg.lookback_window,
+        'rebal': cfg.rebalance_frequency,
+        'cost_bps': cfg.transaction_cost_bps,
+        'stop_loss_pct': cfg.stop_loss_pct,
+    })
+    equity_det, daily_det = context.run(verbose=True)
+    det_metrics = compute_metrics(equity_det, daily_det, all_returns.index, cfg.lookback_window)
+    bh_returns = bh_future.result()
 
     print("\nDeterministic Backtest complete")
     print(f"  Final equity: {det_metrics['final_equity']:.4f}")
     print(f"  Sharpe ratio: {det_metrics['sharpe']:.2f}")
     print(f"  Sortino ratio: {det_metrics['sortino']:.2f}")
-    for year, data in det_metrics['annual_returns'].items():
-        print(f"  {year}  Return: {data['return']:.2%}  Sharpe: {data['sharpe']:.2f}")
+    print(det_metrics['annual_returns'].to_string(
+        formatters={'return': '{:.2%}'.format, 'sharpe': '{:.2f}'.format}
+    ))
     print("\nBuy-and-Hold Returns:")
     print(bh_returns)
-    snp = snp500_returns()
+    snp = snp_future.result()
     if not snp.empty:
         spy_return = snp['Return'].iloc[0]  # Extract scalar
         print(f"\nS&P 500 (SPY) return: {spy_return:.2%}")
@@ -271,9 +469,11 @@ def run_backtest(progress_interval: int = 100, save_plots: bool = True):
     else:
         print("\nS&P 500 data not available – skipping benchmark.")
 
+    # One stamp per run, so both plots from the same run share it
+    run_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     if save_plots: 
         os.makedirs("results", exist_ok=True)
-        plot_path = f"results/backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        plot_path = f"results/backtest_{run_stamp}.png"
         plot_deterministic(det_metrics, plot_path)
         print(f"  Deterministic plot saved to: {plot_path}")
 
@@ -282,65 +482,86 @@ def run_backtest(progress_interval: int = 100, save_plots: bool = True):
     # ==============================
     print("\n" + "="*60)
     print("MONTE CARLO SIMULATION")
-    print(f"Simulations: {config.MONTE_CARLO_SAMPLES}")
-    print(f"Lookback: {config.LOOKBACK_WINDOW}, Rebalance: {config.REBALANCE_FREQUENCY}")
-    print(f"Transaction cost: {config.TRANSACTION_COST_BPS * 10000:.1f} bps")
+    print(f"Simulations: {cfg.monte_carlo_samples}")
+    print(f"Lookback: {cfg.lookback_window}, Rebalance: {cfg.rebalance_frequency}")
+    print(f"Transaction cost: {cfg.transaction_cost_bps * 10000:.1f} bps")
     print("="*60)
 
-    final_equities = []
-    equity_curves = []
-    all_annual_returns = []
-
-    for sim in range(config.MONTE_CARLO_SAMPLES):
-        if sim % progress_interval == 0:
-            print(f"  Simulation {sim}/{config.MONTE_CARLO_SAMPLES}...")
-
-        idx = np.random.choice(n_bars, size=n_bars, replace=True)
-        boot_returns = all_returns.iloc[idx].reset_index(drop=True)
-        boot_returns.index = all_returns.index
-
-        equity, daily_ret = run_single_simulation(
-            boot_returns,
-            window=config.LOOKBACK_WINDOW,
-            rebal=config.REBALANCE_FREQUENCY,
-            cost_bps=config.TRANSACTION_COST_BPS,
-            stop_loss_pct=config.STOP_LOSS_PCT,
-            verbose=False
-        )
-        final_equities.append(equity[-1])
-        equity_curves.append(equity)
-
-        daily_series = pd.Series(daily_ret, index=boot_returns.index[config.LOOKBACK_WINDOW:
-                                                                     config.LOOKBACK_WINDOW + len(daily_ret)])
-        annual_ret = daily_series.groupby(daily_series.index.year).sum()
-        all_annual_returns.extend(annual_ret.values)
-
-    final_equities = np.array(final_equities)
-    annual_returns = np.array(all_annual_returns)
-
-    var_95 = np.percentile(final_equities, 5)
+    n_sims = cfg.monte_carlo_samples
+    n_steps = max(n_bars - cfg.lookback_window, 0)
+    # Paths are stored in float32 (half the memory and IPC); summary
+    # statistics below are taken in float64.
+    equity_curves = np.empty((n_sims, n_steps + 1), dtype=np.float32)
+    daily_paths = np.empty((n_sims, n_steps), dtype=np.float32)
+
+    # Resamples are drawn in the parent, one chunk of paths at a time, so
+    # results don't depend on worker scheduling and the index matrix never
+    # exceeds _BOOTSTRAP_CHUNK rows.
+    with _context_pool(context, max_workers) as pool:
+        for start in range(0, n_sims, _BOOTSTRAP_CHUNK):
+            draws = rng.integers(n_bars, size=(min(_BOOTSTRAP_CHUNK, n_sims - start), n_bars), dtype=np.int32)
+            for sim, (equity, daily_ret) in enumerate(pool.map(_bootstrap_one, draws), start):
+                if sim % progress_interval == 0:
+                    print(f"  Simulation {sim}/{cfg.monte_carlo_samples}...")
+                equity_curves[sim] = equity
+                daily_paths[sim] = daily_ret
+
+    final_equities = equity_curves[:, -1].astype(np.float64)
+
+    # Resampling shuffles rows but keeps the dates, so every path shares the
+    # same year boundaries: one reduceat sums all paths' years at once.
+    annual_returns = np.zeros(0)
+    if n_steps:
+        years = all_returns.index[cfg.lookback_window:cfg.lookback_window + n_steps].year
+        year_starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        annual_returns = np.add.reduceat(daily_paths, year_starts, axis=1, dtype=np.float64).ravel()
+
+    # One selection pass for all three quantiles (np.percentile partitions
+    # rather than sorts); the CVaR tail is a linear masked mean.
+    var_95, median_eq, upside_95 = np.percentile(final_equities, [5, 50, 95])
     cvar_95 = final_equities[final_equities <= var_95].mean()
     prob_loss = np.mean(final_equities < 1.0)
 
     print("\nMonte Carlo Results")
     print(f"  Mean final equity:   {np.mean(final_equities):.4f}")
-    print(f"  Median final equity: {np.median(final_equities):.4f}")
+    print(f"  Median final equity: {median_eq:.4f}")
     print(f"  Std Dev:             {np.std(final_equities):.4f}")
     print(f"  VaR (95%):           {var_95:.4f}  (5% chance below this)")
     print(f"  CVaR (95%):          {cvar_95:.4f}  (avg loss in worst 5%)")
     print(f"  Probability of loss: {prob_loss:.2%}")
     print(f"  Expected loss (VaR): {(1 - var_95) * 100:.2f}%")
-    print(f"  Upside potential (95%): {(np.percentile(final_equities, 95) - 1) * 100:.2f}%")
+    print(f"  Upside potential (95%): {(upside_95 - 1) * 100:.2f}%")
     print(f"  Mean annual return:  {np.mean(annual_returns):.2%}")
     print(f"  Std annual return:   {np.std(annual_returns):.2%}")
 
     if save_plots:
-        plot_path_mc = f"results/monte_carlo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        plot_monte_carlo(equity_curves, final_equities, annual_returns, plot_path_mc)
+        plot_path_mc = f"results/monte_carlo_{run_stamp}.png"
+        plot_monte_carlo(equity_curves, final_equities, annual_returns, plot_path_mc, rng=rng)
         print(f"  Monte Carlo plot saved to: {plot_path_mc}")
+
+    return {
+        'returns': all_returns,
+        'deterministic': det_metrics,
+        'buy_and_hold': bh_returns,
+        'spy': snp,
+        'monte_carlo': {
+            'equity_curves': equity_curves,
+            'final_equities': final_equities,
+            'annual_returns': annual_returns,
+            'var_95': var_95,
+            'cvar_95': cvar_95,
+            'prob_loss': prob_loss,
+        },
+    }
     
     
 
 
 if __name__ == "__main__":
-    run_backtest()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the deterministic and Monte Carlo backtests.")
+    parser.add_argument('--plot', action='store_true', help="save equity and Monte Carlo plots to results/")
+    parser.add_argument('--workers', type=int, default=None, help="Monte Carlo worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=None, help="seed for Monte Carlo resampling")
+    args = parser.parse_args()
+    run_backtest(save_plots=args.plot, max_workers=args.workers, seed=args.seed)
\ No newline at end of file
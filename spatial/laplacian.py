@@ -1,48 +1,211 @@
 import numpy as np
 import pandas as pd
 import networkx as nx
+import scipy.sparse as sp
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse.linalg import factorized
+from typing import Sequence, Union
 from core import config
 
+# Graphs at least this large and at most this dense solve the diffusion
+# system on a sparse LU factor; smaller or denser ones use dense Cholesky.
+_SPARSE_MIN_NODES = 200
+_SPARSE_MAX_DENSITY = 0.05
+
+def laplacian_from_adjacency(adj: np.ndarray) -> np.ndarray:
+    """Normalised Laplacian D^-1/2·(D − A)·D^-1/2 of a dense weighted adjacency.
+
+    Matches ``nx.normalized_laplacian_matrix`` entry for entry, including
+    all-zero rows for isolated nodes.
+    """
+    degree = adj.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        inv_sqrt = 1.0 / np.sqrt(degree)
+    inv_sqrt[np.isinf(inv_sqrt)] = 0.0
+
+    L = -adj
+    L.flat[::len(degree) + 1] += degree
+    L *= inv_sqrt[None, :]
+    L *= inv_sqrt[:, None]
+    return L
+
+
 class SpatialGraph:
     def __init__(self, correlation_threshold: float = config.CORRELATION_THRESHOLD, alpha: float = config.ALPHA):
         self.correlation_threshold = correlation_threshold
         self.alpha = alpha
         self.laplacian = None
         self.adjacency_matrix = None
+        self._laplacian_sparse = None
+        self._diffusion_solver = None
 
-    def build_graph(self, returns: pd.DataFrame) -> nx.Graph:
-        """Build a correlation-based graph where edges exceed the threshold."""
-        corr_matrix = returns.corr()
-        self.adjacency_matrix = corr_matrix
-
-        adj = corr_matrix.copy()
-        for col in adj.columns:
-            adj.loc[col, col] = 0
-        adj = adj.where(adj >= self.correlation_threshold, 0.0)
+    def build_graph(self, returns: Union[pd.DataFrame, np.ndarray], labels: Sequence = None,
+                    corr: np.ndarray = None) -> nx.Graph:
+        """Build a correlation-based graph where edges exceed the threshold.
 
-        return nx.from_pandas_adjacency(adj)
+        Accepts either a returns DataFrame or a raw (bars × assets) array; for
+        arrays, node labels come from ``labels`` (defaults to column positions).
+        A precomputed correlation matrix (e.g. from ``RollingCorrelation``)
+        can be passed as ``corr`` to skip recomputing it from ``returns``.
+        """
+        corr_matrix = self._correlation_frame(returns, labels, corr)
+        adj = self._thresholded_adjacency(corr_matrix)
+        return nx.from_numpy_array(adj, nodelist=list(corr_matrix.columns))
 
     def compute_laplacian(self, G: nx.Graph) -> np.ndarray:
         """Compute the normalised Graph Laplacian."""
-        self.laplacian = nx.normalized_laplacian_matrix(G).toarray()
-        return self.laplacian
+        L = nx.normalized_laplacian_matrix(G)
+        return self._store_laplacian(L.toarray(), L)
+
+    def compute_laplacian_from_returns(self, returns: Union[pd.DataFrame, np.ndarray], labels: Sequence = None,
+                                       corr: np.ndarray = None) -> np.ndarray:
+        """``build_graph`` followed by ``compute_laplacian``, without building a networkx graph.
+
+        Takes the same arguments as ``build_graph``, sets ``adjacency_matrix``
+        and ``laplacian`` the same way, and returns the Laplacian.
+        """
+        corr_matrix = self._correlation_frame(returns, labels, corr)
+        return self._store_laplacian(laplacian_from_adjacency(self._thresholded_adjacency(corr_matrix)))
+
+    def _correlation_frame(self, returns: Union[pd.DataFrame, np.ndarray], labels: Sequence,
+                           corr: np.ndarray) -> pd.DataFrame:
+        if isinstance(returns, pd.DataFrame) and corr is None:
+            corr_matrix = returns.corr()
+        else:
+            if corr is None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    corr = np.corrcoef(returns, rowvar=False)
+            if labels is None:
+                labels = returns.columns if isinstance(returns, pd.DataFrame) else None
+            if labels is None:
+                labels = range(corr.shape[0])
+            corr_matrix = pd.DataFrame(corr, index=labels, columns=labels)
+        self.adjacency_matrix = corr_matrix
+        return corr_matrix
+
+    def _thresholded_adjacency(self, corr_matrix: pd.DataFrame) -> np.ndarray:
+        adj = corr_matrix.to_numpy(dtype=np.float64, copy=True)
+        np.fill_diagonal(adj, 0.0)
+        adj[~(adj >= self.correlation_threshold)] = 0.0  # also clears NaN correlations
+        return adj
 
-    def compute_diffusion_signal(self, current_returns: pd.Series) -> pd.Series:
+    def _store_laplacian(self, L: np.ndarray, L_sparse=None) -> np.ndarray:
+        n = L.shape[0]
+        nnz = L_sparse.nnz if L_sparse is not None else np.count_nonzero(L)
+        sparse = n >= _SPARSE_MIN_NODES and nnz <= _SPARSE_MAX_DENSITY * n * n
+        if not sparse:
+            self._laplacian_sparse = None
+        else:
+            self._laplacian_sparse = L_sparse.tocsc() if L_sparse is not None else sp.csc_matrix(L)
+        self.laplacian = L
+        self._diffusion_solver = None
+        return L
+
+    def compute_diffusion_signal(self, current_returns: Union[pd.Series, np.ndarray]) -> Union[pd.Series, np.ndarray]:
         """Solve h = (I - α·L)⁻¹ · x  for the equilibrium diffusion state."""
         if self.laplacian is None:
             raise ValueError("Laplacian not computed. Call build_graph and compute_laplacian first.")
 
-        x = current_returns.values
+        x = np.asarray(current_returns, dtype=np.float64)
         n = len(x)
-        A = np.eye(n) - self.alpha * self.laplacian
 
+        # Factor once per Laplacian and reuse the factor for every solve.
         try:
-            h = np.linalg.solve(A, x)
-        except np.linalg.LinAlgError:
-            h = x
+            solver = self._diffusion_solver
+            if solver is None or solver[0] is not self.laplacian:
+                solver = (self.laplacian, self._factor_diffusion(n))
+                self._diffusion_solver = solver
+            h = solver[1](x)
+        except (np.linalg.LinAlgError, RuntimeError):
+            # Not positive definite (α ≥ 0.5 on a bipartite component), or a
+            # singular sparse factor
+            try:
+                h = np.linalg.solve(self._diffusion_matrix(), x)
+            except np.linalg.LinAlgError:
+                h = x
+
+        if isinstance(current_returns, pd.Series):
+            return pd.Series(h, index=current_returns.index)
+        return h
+
+    def _factor_diffusion(self, n: int):
+        """Return a solver for (I - α·L) h = x.
 
-        return pd.Series(h, index=current_returns.index)
+        I - α·L is symmetric with eigenvalues in [1 - 2α, 1], so for α < 0.5 it
+        is positive definite and dense Cholesky applies; large sparse graphs
+        use a sparse LU factor instead.
+        """
+        if self._laplacian_sparse is not None:
+            A = sp.identity(n, format='csc') - self.alpha * self._laplacian_sparse
+            return factorized(A.tocsc())
+        # The Laplacian comes from a NaN-cleared adjacency, so LAPACK's
+        # potrf/potrs run without the finiteness scans; potrf overwrites
+        # the scratch matrix in place.
+        factor = cho_factor(self._diffusion_matrix(), lower=True, overwrite_a=True, check_finite=False)
+        return lambda x: cho_solve(factor, x, check_finite=False)
 
-    def get_residuals(self, current_returns: pd.Series, diffusion_signal: pd.Series) -> pd.Series:
+    def _diffusion_matrix(self) -> np.ndarray:
+        """Dense I - α·L, built by shifting the diagonal of -α·L rather than allocating an identity."""
+        A = -self.alpha * self.laplacian
+        A.flat[::A.shape[0] + 1] += 1.0
+        return A
+
+    def get_residuals(self, current_returns: Union[pd.Series, np.ndarray],
+                      diffusion_signal: Union[pd.Series, np.ndarray]) -> Union[pd.Series, np.ndarray]:
         """Return residuals e = x − h (deviations from equilibrium)."""
         return current_returns - diffusion_signal
+
+
+class RollingCorrelation:
+    """
+    Correlation matrix of a sliding row window over ``data``.
+
+    Keeps the window's column sums and cross-products (centred on the mean
+    at the last full recompute) and applies the rows entering and leaving
+    the window as low-rank updates, accumulating in float64 whatever the
+    input dtype. Jumps of half a window or more, moves
+    backwards, and every ``window`` updated rows fall back to an exact
+    ``np.corrcoef`` pass, which also bounds floating-point drift.
+    """
+
+    def __init__(self, data: np.ndarray, window: int):
+        self.data = data
+        self.window = window
+        self._end = None
+        self._since_exact = 0
+
+    def at(self, end: int) -> np.ndarray:
+        """Correlation of ``data[end - window:end]``."""
+        w = self.window
+        step = None if self._end is None else end - self._end
+        if step is None or step < 0 or 2 * step >= w or self._since_exact + step > w:
+            return self._exact(end)
+
+        if step:
+            leaving = self.data[self._end - w: end - w] - self._center
+            entering = self.data[self._end: end] - self._center
+            self._sum += entering.sum(axis=0) - leaving.sum(axis=0)
+            self._cross += entering.T @ entering - leaving.T @ leaving
+            self._end = end
+            self._since_exact += step
+
+        mean = self._sum / w
+        cov = (self._cross - w * np.outer(mean, mean)) / (w - 1)
+        var = np.diag(cov).copy()
+        # Columns that went flat only cancel to round-off; treat them as
+        # constant so they come out NaN, as np.corrcoef would.
+        var[var <= 1e-10 * np.diag(self._cross) / w] = np.nan
+        sd = np.sqrt(var)
+        corr = cov / np.outer(sd, sd)
+        return np.clip(corr, -1.0, 1.0, out=corr)
+
+    def _exact(self, end: int) -> np.ndarray:
+        block = self.data[end - self.window: end].astype(np.float64)
+        self._center = block.mean(axis=0)
+        centred = block - self._center
+        self._sum = centred.sum(axis=0)
+        self._cross = centred.T @ centred
+        self._end = end
+        self._since_exact = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.corrcoef(block, rowvar=False)
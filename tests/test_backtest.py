@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation.backtest import run_single_simulation, sweep
+from spatial.laplacian import SpatialGraph
+from topological.homology import TopologicalFeatureExtractor
+from integration.decision_engine import IntegrationEngine
+
+@pytest.fixture(scope='module')
+def sample_returns():
+    np.random.seed(7)
+    factor = np.random.randn(300, 1) * 0.01
+    data = factor + np.random.randn(300, 6) * 0.01
+    index = pd.bdate_range('2020-01-01', periods=300)
+    return pd.DataFrame(data, index=index, columns=['A', 'B', 'C', 'D', 'E', 'F'])
+
+def test_single_simulation_shapes(sample_returns):
+    equity, pnl = run_single_simulation(sample_returns, window=40, rebal=10, cost_bps=0.001, stop_loss_pct=0.05)
+
+    assert len(pnl) == len(sample_returns) - 40
+    assert len(equity) == len(pnl) + 1
+    assert equity[0] == 1.0
+    assert np.allclose(equity[1:], np.cumprod(1 + pnl))
+
+def _reference_simulation(returns, window, rebal, cost_bps, stop_loss_pct):
+    """Bar-by-bar bookkeeping as in the original pandas loop; also counts stop-outs."""
+    spatial, topo, engine = SpatialGraph(), TopologicalFeatureExtractor(cache_size=0), IntegrationEngine()
+    values, pnl = [1.0], []
+    prev_weights = np.zeros(returns.shape[1])
+    stops = 0
+    for i in range(window - 1, len(returns) - 1):
+        window_returns = returns.iloc[i - window + 1: i + 1]
+        current = window_returns.iloc[-1]
+        if i % rebal == 0:
+            try:
+                spatial.compute_laplacian(spatial.build_graph(window_returns))
+                diagrams = topo.compute_persistence_diagrams(topo.create_point_cloud(spatial.adjacency_matrix))
+                regime_metrics = topo.get_regime_metrics(diagrams)
+                residuals = spatial.get_residuals(current, spatial.compute_diffusion_signal(current))
+            except Exception:
+                residuals = pd.Series(0.0, index=current.index)
+                regime_metrics = {'max_persistence_h1': 0.0}
+            drawdown = values[-1] / max(values[-252:]) - 1
+            signals = engine.generate_signals(residuals, regime_metrics, current_drawdown=drawdown,
+                                              returns_history=pd.Series(pnl))
+            weights = signals['Signal'].to_numpy().copy()
+        else:
+            weights = prev_weights.copy()
+
+        stopped = weights * returns.iloc[i].to_numpy() < -stop_loss_pct
+        stops += stopped.sum()
+        weights[stopped] = 0.0
+        cost = np.abs(weights - prev_weights).sum() * cost_bps
+        prev_weights = weights
+
+        step = weights @ returns.iloc[i + 1].to_numpy() - cost
+        pnl.append(step)
+        values.append(values[-1] * (1 + step))
+    return np.array(values), np.array(pnl), stops
+
+def test_single_simulation_matches_reference_loop(sample_returns):
+    # The simulation stores returns as float32; feed the reference the same values
+    returns = sample_returns.astype(np.float32).astype(np.float64)
+    params = dict(window=40, rebal=10, cost_bps=0.001, stop_loss_pct=0.002)
+    expected_equity, expected_pnl, stops = _reference_simulation(returns, **params)
+    equity, pnl = run_single_simulation(returns, **params)
+
+    assert stops > 0
+    np.testing.assert_allclose(pnl, expected_pnl, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(equity, expected_equity, rtol=1e-9)
+
+def test_sweep_matches_serial_runs(sample_returns):
+    grid = [{'window': 40, 'rebal': 10, 'alpha': 0.3}, {'window': 60, 'rebal': 20, 'alpha': 0.5}]
+    results = sweep(sample_returns, grid, max_workers=2)
+
+    assert len(results) == 2
+    for row, params in zip(results.to_dict('records'), grid):
+        equity, _ = run_single_simulation(
+            sample_returns, cost_bps=row['cost_bps'], stop_loss_pct=row['stop_loss_pct'],
+            correlation_threshold=row['correlation_threshold'], **params
+        )
+        assert row['final_equity'] == pytest.approx(equity[-1])
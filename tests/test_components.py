@@ -3,13 +3,15 @@ import numpy as np
 import pandas as pd
 import sys
 import os
+import warnings
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from spatial.laplacian import SpatialGraph
+from spatial.laplacian import SpatialGraph, RollingCorrelation, laplacian_from_adjacency
 from topological.homology import TopologicalFeatureExtractor
+from integration.decision_engine import IntegrationEngine
 
-@pytest.fixture
+@pytest.fixture(scope='module')
 def sample_returns():
     np.random.seed(42)
     df = pd.DataFrame(np.random.randn(100, 5), columns=['A', 'B', 'C', 'D', 'E'])
@@ -20,30 +22,74 @@ def sample_returns():
 def spatial_graph():
     return SpatialGraph(correlation_threshold=0.5, alpha=0.5)
 
+@pytest.fixture(scope='module')
+def built_graph(sample_returns):
+    """Graph and Laplacian built once for the tests that only read them."""
+    spatial = SpatialGraph(correlation_threshold=0.5, alpha=0.5)
+    G = spatial.build_graph(sample_returns)
+    spatial.compute_laplacian(G)
+    return spatial, G
+
 @pytest.fixture
 def topo_extractor():
     return TopologicalFeatureExtractor()
 
-def test_spatial_graph_construction(spatial_graph, sample_returns):
-    G = spatial_graph.build_graph(sample_returns)
+def test_spatial_graph_construction(built_graph):
+    _, G = built_graph
     assert G.number_of_nodes() == 5
     assert G.has_edge('A', 'B')
 
-def test_laplacian_shape(spatial_graph, sample_returns):
-    G = spatial_graph.build_graph(sample_returns)
-    L = spatial_graph.compute_laplacian(G)
-    assert L.shape == (5, 5)
+def test_laplacian_shape(built_graph):
+    spatial, _ = built_graph
+    assert spatial.laplacian.shape == (5, 5)
 
-def test_diffusion_signal(spatial_graph, sample_returns):
-    G = spatial_graph.build_graph(sample_returns)
-    spatial_graph.compute_laplacian(G)
-    
+def test_diffusion_signal(built_graph, sample_returns):
+    spatial, _ = built_graph
     current = sample_returns.iloc[-1]
-    h = spatial_graph.compute_diffusion_signal(current)
+    h = spatial.compute_diffusion_signal(current)
     
     assert len(h) == 5
     assert isinstance(h, pd.Series)
 
+def test_diffusion_signal_solves_system(sample_returns):
+    spatial = SpatialGraph(correlation_threshold=0.5, alpha=0.3)
+    G = spatial.build_graph(sample_returns)
+    L = spatial.compute_laplacian(G)
+
+    for i in (-1, -2):
+        current = sample_returns.iloc[i].to_numpy()
+        h = spatial.compute_diffusion_signal(current)
+        assert np.allclose((np.eye(5) - 0.3 * L) @ h, current)
+
+def test_diffusion_signal_sparse_graph():
+    import networkx as nx
+    G = nx.random_regular_graph(4, 300, seed=1)
+    spatial = SpatialGraph(alpha=0.3)
+    L = spatial.compute_laplacian(G)
+
+    current = np.random.default_rng(0).normal(size=300)
+    h = spatial.compute_diffusion_signal(current)
+    assert np.allclose((np.eye(300) - 0.3 * L) @ h, current)
+
+def test_laplacian_from_returns_matches_networkx(spatial_graph, sample_returns):
+    import networkx as nx
+    L = spatial_graph.compute_laplacian_from_returns(sample_returns)
+    expected = spatial_graph.compute_laplacian(spatial_graph.build_graph(sample_returns))
+    assert np.allclose(L, expected)
+
+    # An isolated node gets an all-zero row, as in networkx
+    adj = np.array([[0.0, 0.5, 0.0], [0.5, 0.0, 0.0], [0.0, 0.0, 0.0]])
+    expected = nx.normalized_laplacian_matrix(nx.from_numpy_array(adj)).toarray()
+    assert np.allclose(laplacian_from_adjacency(adj), expected)
+
+def test_rolling_correlation_matches_corrcoef(sample_returns):
+    values = sample_returns.to_numpy()
+    rolling = RollingCorrelation(values, 30)
+
+    for end in range(30, 100, 4):
+        expected = np.corrcoef(values[end - 30:end], rowvar=False)
+        assert np.allclose(rolling.at(end), expected)
+
 def test_topological_point_cloud(topo_extractor, sample_returns):
     corr = sample_returns.corr()
     dist = topo_extractor.create_point_cloud(corr)
@@ -60,6 +106,45 @@ def test_persistence_diagrams(topo_extractor, sample_returns):
     assert len(diagrams) >= 1
     assert isinstance(diagrams[0], np.ndarray)
 
+def test_sparse_point_cloud_matches_dense_cutoff(sample_returns):
+    corr = sample_returns.corr()
+    dense = TopologicalFeatureExtractor(max_edge_length=1.2, cache_size=0)
+    sparse = TopologicalFeatureExtractor(cache_size=0)
+
+    expected = dense.compute_persistence_diagrams(dense.create_point_cloud(corr))
+    diagrams = sparse.compute_persistence_diagrams(sparse.create_point_cloud_sparse(corr, 1.2))
+    for got, want in zip(diagrams, expected):
+        assert np.allclose(got, want)
+
+def test_degenerate_point_cloud_skips_ripser(topo_extractor):
+    from ripser import ripser
+    for n in (1, 4):
+        dist = np.zeros((n, n), dtype=np.float32)
+        expected = ripser(dist, maxdim=2, distance_matrix=True)['dgms']
+        diagrams = topo_extractor.compute_persistence_diagrams(dist, maxdim=2)
+        assert len(diagrams) == len(expected)
+        for got, want in zip(diagrams, expected):
+            assert np.array_equal(got, want)
+
+def test_persistence_diagrams_cached(sample_returns):
+    topo = TopologicalFeatureExtractor(cache_size=1)
+    dist = topo.create_point_cloud(sample_returns.corr())
+    diagrams = topo.compute_persistence_diagrams(dist)
+
+    assert topo.compute_persistence_diagrams(dist.copy()) is diagrams
+    topo.compute_persistence_diagrams(topo.create_point_cloud(sample_returns.iloc[:50].corr()))
+    assert topo.compute_persistence_diagrams(dist) is not diagrams
+
+def test_compute_many_matches_serial(sample_returns):
+    topo = TopologicalFeatureExtractor(cache_size=0)
+    clouds = [topo.create_point_cloud(sample_returns.iloc[start:start + 50].corr()) for start in (0, 25, 50, 0)]
+
+    results = topo.compute_many(clouds, max_workers=2)
+    assert len(results) == 4
+    for cloud, diagrams in zip(clouds, results):
+        for got, want in zip(diagrams, topo.compute_persistence_diagrams(cloud)):
+            assert np.array_equal(got, want)
+
 def test_regime_metrics(topo_extractor, sample_returns):
     corr = sample_returns.corr()
     dist = topo_extractor.create_point_cloud(corr)
@@ -68,3 +153,56 @@ def test_regime_metrics(topo_extractor, sample_returns):
     
     assert 'max_persistence_h1' in metrics
     assert isinstance(metrics['max_persistence_h1'], float)
+
+def _reference_signals(residuals, regime_state, h1, engine):
+    """The original pandas selection: top longs by nlargest, shorts by nsmallest."""
+    z = (residuals - residuals.mean()) / (residuals.std() + 1e-6)
+    raw = z if regime_state == 'trend' else -z
+    significant = raw[raw.abs() > 1.0]
+    if significant.empty:
+        significant = raw[raw.abs() > 0.4]
+    top_n = min(6, len(significant))
+    longs = significant[significant > 0].nlargest(top_n)
+    shorts = significant[significant < 0].nsmallest(top_n)
+
+    leverage = engine.leverage_multiplier
+    net = engine.get_adaptive_net_exposure(h1)
+    out = pd.Series(0.0, index=residuals.index)
+    if not longs.empty:
+        w = np.exp(longs * 0.5)
+        out[longs.index] = (1 + net) / 2 * leverage * w / w.sum()
+    if not shorts.empty:
+        w = np.exp(shorts.abs() * 0.5)
+        out[shorts.index] = -(1 - net) / 2 * leverage * w / w.sum()
+    return out
+
+@pytest.mark.parametrize('regime_state', ['trend', 'revert'])
+@pytest.mark.parametrize('values', [
+    np.random.default_rng(1).normal(size=80),                               # 2k < universe
+    [3.0, 3.0, 2.5, 2.5, 2.0, 1.5, -0.1, -1.5, -2.0, -2.0, -2.5, -3.0] * 2,  # tied pairs
+    [0.9, -1.2, 0.3, 2.0, -0.4],                                            # universe < 2k
+], ids=['random', 'ties', 'small'])
+def test_generate_signals_matches_pandas_selection(values, regime_state):
+    residuals = pd.Series(values, index=[f'T{i}' for i in range(len(values))], dtype=float)
+    engine = IntegrationEngine()
+    engine.regime_state = regime_state
+    h1 = 0.02  # inside the hysteresis band, so the regime stays put
+
+    expected = _reference_signals(residuals, regime_state, h1, engine)
+    signals = engine.generate_signals(residuals, {'max_persistence_h1': h1})['Signal']
+
+    # Names tied at the cut-off may be picked either way; the book's weights may not
+    np.testing.assert_allclose(np.sort(signals.to_numpy()), np.sort(expected.to_numpy()), atol=1e-12)
+    boundary = set()
+    for side in (signals, expected):
+        held = side[side != 0].index
+        boundary |= set(residuals.index[residuals.isin(residuals[held])]) - set(held)
+    clear = residuals.index.difference(list(boundary | set(residuals.index[residuals.duplicated(keep=False)])))
+    np.testing.assert_allclose(signals[clear], expected[clear], atol=1e-12)
+
+def test_generate_signals_single_residual_is_flat():
+    engine = IntegrationEngine()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        signals = engine.generate_signals(pd.Series([0.3], index=['A']), {'max_persistence_h1': 0.02})
+    assert (signals['Signal'] == 0).all()
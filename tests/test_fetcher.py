@@ -0,0 +1,74 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import config
+from data import fetcher as fetcher_module
+from data.fetcher import DataFetcher
+
+TIMESTAMPS = [1700000000 + 86400 * i for i in range(4)]
+
+def _spark_payload(close_a, close_b=(10.0, 11.0, 12.0, 13.0)):
+    return {
+        'A': {'timestamp': TIMESTAMPS, 'close': close_a},
+        'B': {'timestamp': TIMESTAMPS, 'close': list(close_b)},
+    }
+
+@pytest.fixture
+def stub_network(monkeypatch):
+    """Serve ``payload`` from urlopen and record yfinance fallback calls."""
+    state = {'payload': None, 'downloads': 0}
+
+    def urlopen(request, timeout=None):
+        return io.BytesIO(json.dumps(state['payload']).encode())
+
+    def download(**kwargs):
+        state['downloads'] += 1
+        columns = pd.MultiIndex.from_product([['A', 'B'], ['Close']])
+        index = pd.to_datetime(TIMESTAMPS, unit='s', utc=True)
+        return pd.DataFrame([[1.0, 2.0]] * len(index), index=index, columns=columns)
+
+    monkeypatch.setattr(fetcher_module, 'urlopen', urlopen)
+    monkeypatch.setattr(fetcher_module, '_download', download)
+    return state
+
+def test_fetch_data_parses_spark_payload(stub_network):
+    stub_network['payload'] = _spark_payload([1.0, 2.0, None, 4.0])
+    prices = DataFetcher(('A', 'B')).fetch_data(lookback_minutes=10)
+
+    assert stub_network['downloads'] == 0
+    assert list(prices.columns) == ['A', 'B']
+    assert np.allclose(prices['A'], [1.0, 2.0, 2.0, 4.0])
+    assert np.allclose(prices['B'], [10.0, 11.0, 12.0, 13.0])
+
+@pytest.mark.parametrize('close_a', [[1.0, 2.0], None], ids=['ragged', 'null'])
+def test_fetch_data_falls_back_on_malformed_spark_payload(stub_network, close_a):
+    stub_network['payload'] = _spark_payload(close_a)
+    prices = DataFetcher(('A', 'B')).fetch_data(lookback_minutes=10)
+
+    assert stub_network['downloads'] == 1
+    assert prices.shape == (4, 2)
+
+def test_stale_logret_cache_is_recomputed(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path))
+    fetcher = DataFetcher(('A', 'B'))
+    index = pd.date_range('2020-01-01', periods=5, name='Date')
+    old = pd.DataFrame({'A': [1.0, 2, 3, 4, 5], 'B': [2.0, 2, 2, 2, 3]}, index=index)
+    stem = fetcher._cache_path('5y')
+    fetcher._write_cache(stem, old)
+
+    # Same shape, newer prices, and a returns cache that predates them
+    new = old * 1.5
+    new.iloc[0] = old.iloc[0]
+    new.reset_index().to_feather(stem + '.arrow')
+    os.utime(stem + '.logret.npy', (0, 0))
+
+    returns = fetcher.fetch_historical_returns('5y')
+    assert np.allclose(returns.to_numpy(), DataFetcher._log_returns(new.to_numpy()))
+    assert os.path.getmtime(stem + '.logret.npy') >= os.path.getmtime(stem + '.arrow')
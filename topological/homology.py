@@ -1,41 +1,158 @@
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from ripser import ripser
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Sequence, Union
 from core import config
 
 
+def _rips_diagrams(distance_matrix: Union[np.ndarray, sp.spmatrix], maxdim: int, thresh: float,
+                   n_perm: Optional[int]) -> List[np.ndarray]:
+    # Only the diagrams are used, so cocycles are never assembled
+    return ripser(distance_matrix, maxdim=maxdim, thresh=thresh, n_perm=n_perm,
+                  distance_matrix=True, do_cocycles=False)['dgms']
+
+
+def _gudhi_diagrams(distance_matrix: np.ndarray, maxdim: int, thresh: float) -> List[np.ndarray]:
+    """Rips diagrams from GUDHI, with edge collapse before the flag expansion, in ripser's layout."""
+    import gudhi
+    if sp.issparse(distance_matrix):
+        raise ValueError("The gudhi backend needs a dense distance matrix")
+    rips = gudhi.RipsComplex(distance_matrix=distance_matrix, max_edge_length=thresh)
+    tree = rips.create_simplex_tree(max_dimension=1)
+    tree.collapse_edges()
+    tree.expansion(maxdim + 1)
+    tree.compute_persistence()
+    return [np.asarray(tree.persistence_intervals_in_dimension(dim), dtype=np.float64).reshape(-1, 2)
+            for dim in range(maxdim + 1)]
+
+
+_BACKENDS = {'ripser': _rips_diagrams, 'gudhi': _gudhi_diagrams}
+
+
 class TopologicalFeatureExtractor:
-    def __init__(self, max_dimension: int = config.MAX_DIMENSION):
+    def __init__(self, max_dimension: int = config.MAX_DIMENSION, cache_size: int = config.DIAGRAM_CACHE_SIZE,
+                 max_edge_length: Optional[float] = config.MAX_EDGE_LENGTH, n_perm: Optional[int] = config.RIPSER_N_PERM,
+                 backend: str = config.TDA_BACKEND):
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown TDA backend {backend!r}; expected one of {sorted(_BACKENDS)}")
         self.max_dimension = max_dimension
+        self.backend = backend
+        self.max_edge_length = max_edge_length
+        self.n_perm = n_perm
+        self.cache_size = cache_size
+        self._diagram_cache = OrderedDict()
 
     def create_point_cloud(self, correlation_matrix: pd.DataFrame) -> np.ndarray:
         """Convert a correlation matrix to a distance matrix: d = √(2·(1 − ρ))."""
-        corr = correlation_matrix.values
-        dist_matrix = np.sqrt(2 * (1 - corr).clip(min=0))
-        if not dist_matrix.flags.writeable:
-            dist_matrix = dist_matrix.copy()
+        # Float64 frames hand over their block without a copy. Kept at
+        # float64: 1 - ρ loses the small distances in float32.
+        corr = correlation_matrix.to_numpy(dtype=np.float64, copy=False)
+        # One fresh buffer, then each step in place on it
+        dist_matrix = np.subtract(1, corr)
+        np.maximum(dist_matrix, 0, out=dist_matrix)
+        dist_matrix *= 2
+        np.sqrt(dist_matrix, out=dist_matrix)
         np.fill_diagonal(dist_matrix, 0)
-        return dist_matrix
+        # ripser reads distances as float32 anyway; handing it float32
+        # halves the matrix and saves it a conversion copy.
+        return dist_matrix.astype(np.float32)
+
+    def create_point_cloud_sparse(self, correlation_matrix: pd.DataFrame, thresh: float) -> sp.coo_matrix:
+        """Distance matrix keeping only pairs closer than ``thresh``, as upper-triangle COO.
 
-    def compute_persistence_diagrams(self, distance_matrix: np.ndarray) -> List[np.ndarray]:
+        Missing pairs are treated by ripser as infinitely far apart, so the
+        diagrams match a dense run with ``thresh`` as the edge cut-off.
+        """
+        dist = self.create_point_cloud(correlation_matrix)
+        rows, cols = np.nonzero(np.triu(dist < thresh, 1))
+        return sp.coo_matrix((dist[rows, cols], (rows, cols)), shape=dist.shape)
+
+    def compute_persistence_diagrams(self, distance_matrix: Union[np.ndarray, sp.spmatrix],
+                                     maxdim: Optional[int] = None) -> List[np.ndarray]:
         """Compute persistence diagrams via Vietoris-Rips filtration."""
-        results = ripser(distance_matrix, maxdim=self.max_dimension - 1, distance_matrix=True)
-        return results['dgms']
+        maxdim = self.max_dimension - 1 if maxdim is None else maxdim
+        if not sp.issparse(distance_matrix) and not distance_matrix.any():
+            # Every point coincides (a single ticker, or a window where all
+            # moved in lockstep): one essential H0 class and nothing else.
+            return [np.array([[0.0, np.inf]])] + [np.empty((0, 2)) for _ in range(maxdim)]
+
+        key = (maxdim,) + self._diagram_key(distance_matrix)
+        cache = self._diagram_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        diagrams = self._diagram_function(maxdim)(distance_matrix)
+        self._remember(key, diagrams)
+        return diagrams
+
+    def compute_many(self, distance_matrices: Sequence[Union[np.ndarray, sp.spmatrix]],
+                     max_workers: Optional[int] = None, maxdim: Optional[int] = None) -> List[List[np.ndarray]]:
+        """``compute_persistence_diagrams`` for many matrices, with the ripser runs spread over processes.
+
+        Cache hits and repeated matrices are resolved in this process; only
+        distinct misses are sent to the pool, and their diagrams are cached.
+        """
+        maxdim = self.max_dimension - 1 if maxdim is None else maxdim
+        keys = [(maxdim,) + self._diagram_key(dm) for dm in distance_matrices]
+        cache = self._diagram_cache
+        found, misses = {}, {}
+        for key, dm in zip(keys, distance_matrices):
+            if key in cache:
+                cache.move_to_end(key)
+                found[key] = cache[key]
+            elif key not in misses:
+                misses[key] = dm
+
+        if misses:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                computed = pool.map(self._diagram_function(maxdim), misses.values())
+                for key, diagrams in zip(misses, computed):
+                    found[key] = diagrams
+                    self._remember(key, diagrams)
+        return [found[key] for key in keys]
+
+    def _diagram_function(self, maxdim: int) -> Callable[[Union[np.ndarray, sp.spmatrix]], List[np.ndarray]]:
+        """The configured backend bound to this extractor's settings; picklable for the process pool."""
+        thresh = np.inf if self.max_edge_length is None else self.max_edge_length
+        if self.backend == 'gudhi':
+            return partial(_gudhi_diagrams, maxdim=maxdim, thresh=thresh)
+        return partial(_rips_diagrams, maxdim=maxdim, thresh=thresh, n_perm=self.n_perm)
+
+    def _remember(self, key: tuple, diagrams: List[np.ndarray]):
+        if self.cache_size > 0:
+            self._diagram_cache[key] = diagrams
+            if len(self._diagram_cache) > self.cache_size:
+                self._diagram_cache.popitem(last=False)
+
+    @staticmethod
+    def _diagram_key(distance_matrix: Union[np.ndarray, sp.spmatrix]) -> tuple:
+        # Hashed at float32, the precision ripser computes at
+        digest = hashlib.blake2b(digest_size=16)
+        if sp.issparse(distance_matrix):
+            coo = distance_matrix.tocoo()
+            for part in (coo.row, coo.col, coo.data.astype(np.float32)):
+                digest.update(np.ascontiguousarray(part))
+            return distance_matrix.shape, 'sparse', digest.digest()
+        # create_point_cloud's output is already contiguous float32, so this
+        # hashes its buffer without a copy
+        digest.update(np.ascontiguousarray(distance_matrix, dtype=np.float32).data)
+        return distance_matrix.shape, 'dense', digest.digest()
 
     def get_regime_metrics(self, diagrams: List[np.ndarray]) -> Dict[str, float]:
         """Extract scalar regime metrics from H1 persistence."""
         h1 = diagrams[1]
 
-        if h1.size == 0:
-            return {'max_persistence_h1': 0.0}
-
-        finite_h1 = h1[np.isfinite(h1[:, 1])]
-        if finite_h1.size == 0:
-            return {'max_persistence_h1': 0.0}
-
-        persistence = finite_h1[:, 1] - finite_h1[:, 0]
+        # One masked reduction over the lifetimes; essential (infinite-death)
+        # classes are skipped and an empty diagram gives the initial 0.
+        persistence = h1[:, 1] - h1[:, 0]
+        max_persistence = np.max(persistence, where=np.isfinite(persistence), initial=0.0)
 
         return {
-            'max_persistence_h1': float(np.max(persistence)),
+            'max_persistence_h1': float(max_persistence),
         }